@@ -4,18 +4,32 @@ import xml.etree.ElementTree as ET
 from evdev import InputDevice, list_devices
 import re
 
-# Load and parse the binds file
-tree = ET.parse('~/.local/share/Steam/steamapps/compatdata/359320/pfx/drive_c/users/steamuser/AppData/Local/Frontier Developments/Elite Dangerous/Options/Bindings/Custom.4.2.binds')
-root = tree.getroot()
-
-# Collect all unique device IDs from <Binding Device="...">
-device_ids = set()
-for binding in root.findall('.//Binding'):
-    device = binding.get('Device')
-    if device and device != "{NoDevice}":
-        match = re.match(r'[0-9A-Fa-f]{8}', device.replace('{', '').replace('}', ''))
-        if match:
-            device_ids.add(match.group().upper())
+# Device IDs are 8 hex digits, sometimes wrapped in braces
+_HEX8 = re.compile(r'[0-9A-F]{8}', re.IGNORECASE)
+_STRIP = str.maketrans('', '', '{}')
+
+# Binds file to check
+binds_path = '~/.local/share/Steam/steamapps/compatdata/359320/pfx/drive_c/users/steamuser/AppData/Local/Frontier Developments/Elite Dangerous/Options/Bindings/Custom.4.2.binds'
+
+# Stream the Device attribute of every <Binding>. Every element is cleared once it ends,
+# and finished elements are detached from the root, so the whole tree is never held in memory
+def binding_devices(path):
+    events = ET.iterparse(path, events=('start', 'end'))
+    _, root = next(events)
+    for event, elem in events:
+        if event == 'end':
+            if elem.tag == 'Binding':
+                yield elem.get('Device')
+            elem.clear()
+            root.clear()
+
+# Collect all unique device IDs, only upper-casing once they've been deduplicated
+raw_ids = {
+    match.group()
+    for device in binding_devices(binds_path)
+    if device and device != "{NoDevice}" and (match := _HEX8.match(device.translate(_STRIP)))
+}
+device_ids = {d.upper() for d in raw_ids}
 
 print("Unique device IDs in binds file:")
 for d in device_ids:
@@ -8,12 +8,15 @@
 # This single axis is reported as the X axis in game.
 
 import os
-import time
-import json
+import select
+# orjson parses journal lines noticeably faster, but isn't required
+try:
+    import orjson as json
+except ImportError:
+    import json
 import threading
 from pathlib import Path
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from inotify_simple import INotify, flags
 from evdev import InputDevice, UInput, ecodes, AbsInfo
 
 # CONFIGURATION -----------------------------------------
@@ -28,8 +31,8 @@ device_path = "/dev/input/event7"  # Replace this with your actual event device
 
 SUPERCRUISE_ACTIVE = False
 GAME_RUNNING = False
-last_log_update = time.time()
 last_throttle_value = 0
+last_emitted_value = None
 
 # Open real joystick
 try:
@@ -54,9 +57,7 @@ print(f"Created virtual device: {ui.device.name}")
 
 def read_current_throttle():
     try:
-        dev.capabilities()  # Refresh device
-        abs_state = dev.absinfo(ecodes.ABS_THROTTLE)
-        return abs_state.value
+        return dev.absinfo(ecodes.ABS_THROTTLE).value
     except Exception as e:
         print(f"Error reading current throttle: {e}")
         return 0
@@ -64,70 +65,98 @@ def read_current_throttle():
 
 # Function to forward or block throttle input
 def forward_throttle(value=None, force=False):
-    global last_throttle_value
+    global last_throttle_value, last_emitted_value
     if value is not None:
         last_throttle_value = value
-    value_to_use = last_throttle_value
 
     if SUPERCRUISE_ACTIVE or not GAME_RUNNING or force:
-        ui.write(ecodes.EV_ABS, ecodes.ABS_THROTTLE, value_to_use)
+        value_to_use = last_throttle_value
     else:
-        ui.write(ecodes.EV_ABS, ecodes.ABS_THROTTLE, 0)
-    ui.syn()
+        value_to_use = 0
+
+    # Nothing to tell the virtual device if the output hasn't changed
+    if value_to_use != last_emitted_value or force:
+        ui.write(ecodes.EV_ABS, ecodes.ABS_THROTTLE, value_to_use)
+        ui.syn()
+        last_emitted_value = value_to_use
 
 # Send initial value
 forward_throttle(force=True)
 
 
-class JournalHandler(FileSystemEventHandler):
+class JournalHandler:
     def __init__(self):
-        super().__init__()
         self.last_timestamp = None
-        self.file_positions = {}
-
-    def on_modified(self, event):
-        global SUPERCRUISE_ACTIVE, GAME_RUNNING, last_log_update
-        if not event.is_directory and event.src_path.endswith(".log"):
-            log_path = event.src_path
-            last_log_update = time.time()
-
-            if log_path not in self.file_positions:
-                self.file_positions[log_path] = 0
+        self.handles = {}
+        self.tails = {}
+        self.inactivity_timer = None
+
+    def mark_not_running(self):
+        global GAME_RUNNING
+        if GAME_RUNNING:
+            print("[ED] Game not running or journal inactive.")
+        GAME_RUNNING = False
+
+    def on_modified(self, log_path):
+        global SUPERCRUISE_ACTIVE, GAME_RUNNING
+        if log_path.endswith(".log"):
+            # Consider the game gone once the journal has been quiet for 15 seconds
+            if self.inactivity_timer:
+                self.inactivity_timer.cancel()
+            self.inactivity_timer = threading.Timer(15, self.mark_not_running)
+            self.inactivity_timer.daemon = True
+            self.inactivity_timer.start()
 
             try:
-                with open(log_path, 'r', encoding='utf-8') as f:
-                    f.seek(self.file_positions[log_path])
-                    new_lines = f.readlines()
-                    self.file_positions[log_path] = f.tell()
-
-                    if not GAME_RUNNING and new_lines:
-                        print("[ED] Game journal detected.")
-
-                    GAME_RUNNING = True
-
-                    for line in new_lines:
-                        if not line.strip():
-                            continue
-                        data = json.loads(line)
-
-                        timestamp = data.get("timestamp")
-                        if self.last_timestamp and timestamp <= self.last_timestamp:
-                            continue  # Skip old or duplicate events
-
-                        self.last_timestamp = timestamp
-
-                        event_type = data.get("event")
-                        if data.get("event") == "SupercruiseEntry":
-                            if not SUPERCRUISE_ACTIVE:
-                                SUPERCRUISE_ACTIVE = True
-                                current_val = read_current_throttle()
-                                print(f"[ED] Entered Supercruise, setting throttle to current value: {current_val}")
-                                forward_throttle(current_val, force=True)
-                        elif event_type == "SupercruiseExit":
-                            if SUPERCRUISE_ACTIVE:
-                                SUPERCRUISE_ACTIVE = False
-                                print("[ED] Exited Supercruise")
-                                forward_throttle(0, force=True)
+                # Keep the journal open and only read what was appended since last time.
+                # The game only writes the newest journal, so drop handles to older ones.
+                if log_path not in self.handles:
+                    for old_handle in self.handles.values():
+                        old_handle.close()
+                    self.handles = {log_path: open(log_path, 'rb', buffering=0)}
+                    self.tails = {log_path: bytearray()}
+                fd = self.handles[log_path].fileno()
+
+                buf = self.tails[log_path]
+                previous_len = len(buf)
+                while chunk := os.read(fd, 1 << 16):
+                    buf += chunk
+
+                if not GAME_RUNNING and len(buf) > previous_len:
+                    print("[ED] Game journal detected.")
+
+                GAME_RUNNING = True
+
+                # Consume complete lines from the front of the buffer in place,
+                # leaving any trailing partial line until the rest of it is written
+                while (newline := buf.find(b'\n')) >= 0:
+                    # Only Supercruise events matter, don't bother copying or parsing anything else
+                    line = None
+                    if buf.find(b'"SupercruiseEntry"', 0, newline) >= 0 or buf.find(b'"SupercruiseExit"', 0, newline) >= 0:
+                        line = bytes(buf[:newline])
+                    del buf[:newline + 1]
+                    if line is None:
+                        continue
+                    data = json.loads(line)
+
+                    timestamp = data.get("timestamp")
+                    if self.last_timestamp and timestamp <= self.last_timestamp:
+                        continue  # Skip old or duplicate events
+
+                    self.last_timestamp = timestamp
+
+                    event_type = data.get("event")
+                    if data.get("event") == "SupercruiseEntry":
+                        if not SUPERCRUISE_ACTIVE:
+                            SUPERCRUISE_ACTIVE = True
+                            current_val = read_current_throttle()
+                            print(f"[ED] Entered Supercruise, setting throttle to current value: {current_val}")
+                            forward_throttle(current_val, force=True)
+                    elif event_type == "SupercruiseExit":
+                        if SUPERCRUISE_ACTIVE:
+                            SUPERCRUISE_ACTIVE = False
+                            print("[ED] Exited Supercruise")
+                            forward_throttle(0, force=True)
             except Exception as e:
                 print(f"Error reading journal: {e}")
 
@@ -135,35 +164,46 @@ class JournalHandler(FileSystemEventHandler):
 
 
 
-# Monitor game status separately
-def monitor_game_status():
-    global GAME_RUNNING
+# Watch the journal directory, letting bursts of writes settle for 50 ms
+# so each changed log is only read once per burst
+def watch_journal(inotify, handler):
     while True:
-        if time.time() - last_log_update > 15:
-            if GAME_RUNNING:
-                print("[ED] Game not running or journal inactive.")
-            GAME_RUNNING = False
-        time.sleep(5)
-
-# Start background thread
-threading.Thread(target=monitor_game_status, daemon=True).start()
-
-# Start journal monitor
-observer = Observer()
-observer.schedule(JournalHandler(), str(journal_dir), recursive=False)
-observer.start()
+        events = inotify.read(read_delay=50)
+        for name in {event.name for event in events}:
+            handler.on_modified(str(journal_dir / name))
+
+inotify = INotify()
+inotify.add_watch(str(journal_dir), flags.MODIFY | flags.CREATE)
+journal_handler = JournalHandler()
+threading.Thread(target=watch_journal, args=(inotify, journal_handler), daemon=True).start()
 print("Monitoring Elite Dangerous journal...")
 
 # Start input loop
+# Drain every queued event per wakeup, forwarding only the last throttle value of each SYN frame
+poller = select.epoll()
+poller.register(dev.fd, select.EPOLLIN)
+EV_ABS = ecodes.EV_ABS
+EV_SYN = ecodes.EV_SYN
+ABS_THROTTLE = ecodes.ABS_THROTTLE
 try:
     print("Reading throttle input...")
-    for event in dev.read_loop():
-        if event.type == ecodes.EV_ABS and event.code == ecodes.ABS_THROTTLE:
-            forward_throttle(event.value)
+    while True:
+        poller.poll()
+        pending_throttle = None
+        for event in dev.read():
+            if event.type == EV_ABS and event.code == ABS_THROTTLE:
+                pending_throttle = event.value
+            elif event.type == EV_SYN and pending_throttle is not None:
+                forward_throttle(pending_throttle)
+                pending_throttle = None
+        if pending_throttle is not None:
+            forward_throttle(pending_throttle)
 except KeyboardInterrupt:
     print("Interrupted by user.")
 finally:
     print("Shutting down...")
-    observer.stop()
-    observer.join()
+    if journal_handler.inactivity_timer:
+        journal_handler.inactivity_timer.cancel()
+    inotify.close()
+    poller.close()
     ui.close()
@@ -4,12 +4,18 @@ import sys
 import time
 import argparse
 import os
+import select
 import fcntl
 import array
 import time as systime
 import yaml
 from evdev import InputDevice, categorize, ecodes, UInput, list_devices, AbsInfo
 
+try:
+    import pyudev
+except ImportError:
+    pyudev = None
+
 os.chdir(sys.path[0])
 
 # Argument parsing
@@ -35,6 +41,9 @@ for entry in config.get('key_mappings', []):
     action = entry['action']
     combo_map[(frozenset(mod_combo), key)] = action
 
+# Parse each 'btn_N' action once rather than on every event
+action_to_btn = {action: int(action.replace('btn_', '')) for action in combo_map.values()}
+
 # Target HID device
 TARGET_VENDOR = args.vendor
 TARGET_PRODUCT = args.product
@@ -51,14 +60,47 @@ MOD_KEYS = {
     ecodes.KEY_RIGHTMETA: 'KEY_RIGHTMETA',
 }
 
-mod_state = {k: False for k in MOD_KEYS.values()}
+# One bit per modifier key, so the held modifiers fit in a single int
+MOD_BITS = {name: 1 << i for i, name in enumerate(MOD_KEYS.values())}
+
+# Each button's (modifier mask, F-key code), and which buttons each F-key can trigger
+combo_by_btn = {}
+btns_by_fkey = {}
+for (mods, fkey), action in combo_map.items():
+    btn_num = action_to_btn[action]
+    fkey_code = ecodes.ecodes[fkey]
+    combo_by_btn[btn_num] = (sum(MOD_BITS[mod] for mod in mods), fkey_code)
+    btns_by_fkey.setdefault(fkey_code, []).append(btn_num)
+
+# Every (held modifiers, F-key) pair resolved up front, so a key press is one dict lookup.
+# A combo matches when any one of its modifiers is held, so a pair can press several buttons.
+combo_lookup = {}
+for mod_mask in range(1 << len(MOD_BITS)):
+    for btn_num, (combo_mask, fkey_code) in combo_by_btn.items():
+        if mod_mask & combo_mask:
+            combo_lookup.setdefault((mod_mask, fkey_code), []).append(btn_num)
 
 # Custom base event code for buttons
 CUSTOM_BTN_BASE = 704
 
+# Ask udev which event nodes belong to the target, so only those get opened and probed.
+# udev ORs property matches together, so the product ID is checked here.
+# Without pyudev, or if udev knows nothing, every input device is checked.
+def candidate_paths():
+    if pyudev:
+        context = pyudev.Context()
+        paths = [
+            d.device_node for d in context.list_devices(subsystem='input', ID_VENDOR_ID=f'{TARGET_VENDOR:04x}')
+            if d.properties.get('ID_MODEL_ID') == f'{TARGET_PRODUCT:04x}'
+            and d.device_node and d.device_node.startswith('/dev/input/event')
+        ]
+        if paths:
+            return sorted(paths)
+    return list_devices()
+
 # Find the device
 device_path = None
-for path in list_devices():
+for path in candidate_paths():
     dev = InputDevice(path)
     if dev.info.vendor == TARGET_VENDOR and dev.info.product == TARGET_PRODUCT and ecodes.KEY_F13 in dev.capabilities().get(ecodes.EV_KEY, []):
         device_path = path
@@ -72,6 +114,12 @@ device = InputDevice(device_path)
 device.grab()
 print(f"Listening to: {device.name} ({device_path})")
 
+# Name every key the device can send up front; aliased codes keep their first name
+code_to_name = {}
+for code in device.capabilities().get(ecodes.EV_KEY, []):
+    name = ecodes.KEY.get(code, str(code))
+    code_to_name[code] = name if isinstance(name, str) else name[0]
+
 # Define virtual joystick buttons starting at custom code 704 and add dummy axis
 virt_buttons = [CUSTOM_BTN_BASE + i for i in range(48)]
 
@@ -86,98 +134,79 @@ ui = UInput(events=capabilities, name=f"{dev.name} Virtual Joystick", version=de
 print("Virtual joystick created.")
 print(f"Virtual joystick vendor:product = {ui.device.info.vendor:04X}:{ui.device.info.product:04X}")
 
-# Track state of each button
-button_states = {}
-for (_, _), action in combo_map.items():
-    btn_num = int(action.replace('btn_', ''))
-    button_states[btn_num] = 'released'
-
-# Press tracking
-mod_keys_down = set()
-fkeys_down = set()
+# Press tracking; a button in neither set is released
+mod_mask = 0
+pressed_btns = set()
+releasing_btns = set()
 
 print("Press Ctrl+C to exit.")
+# Wait for the device to become readable, then drain everything it has queued
+poller = select.epoll()
+poller.register(device.fd, select.EPOLLIN)
+# Bind names used on every event once, outside the loop
+EV_KEY = ecodes.EV_KEY
+write = ui.write
+syn = ui.syn
+debug = args.debug
 try:
-    for event in device.read_loop():
-        if event.type != ecodes.EV_KEY:
-            continue
-
-        code = event.code
-        value = event.value
-
-        key_name = ecodes.KEY.get(code, str(code))
-
-        if key_name in mod_state:
-            mod_state[key_name] = bool(value)
-            if value:
-                mod_keys_down.add(key_name)
-            else:
-                mod_keys_down.discard(key_name)
-
-            # Check all buttons in 'releasing' to see if we should finalize them
-            for (mods, fkey), action in combo_map.items():
-                btn_num = int(action.replace('btn_', ''))
-                if button_states[btn_num] == 'releasing' and not (set(mods) & mod_keys_down):
-                    button_states[btn_num] = 'released'
-                    ui.write(ecodes.EV_KEY, CUSTOM_BTN_BASE + btn_num, 0)
-                    ui.syn()
-                    if args.debug:
-                        print(f"{key_name} released, Button {btn_num} → RELEASED")
-            continue
-
-        if key_name.startswith("KEY_F"):
-            if value:
-                fkeys_down.add(key_name)
-            else:
-                fkeys_down.discard(key_name)
-
-        active_mods = frozenset([k for k, v in mod_state.items() if v])
-
-        if value == 1:  # key press
-            # transition pressing
-            for (mods, fkey), action in combo_map.items():
-                btn_num = int(action.replace('btn_', ''))
-                # Check if any modifier key in the combination is pressed
-                if any(mod in active_mods for mod in mods) and button_states[btn_num] == 'released':
-                    button_states[btn_num] = 'pressing'
-                    if args.debug:
-                        print(f"Key {key_name} → Button {btn_num} PRESSING")  # Show the key being pressed
-            # transition to pressed
-            for (mods, fkey), action in combo_map.items():
-                if fkey == key_name:
-                    btn_num = int(action.replace('btn_', ''))
-                    if button_states[btn_num] == 'pressing':
-                        button_states[btn_num] = 'pressed'
-                        ui.write(ecodes.EV_KEY, CUSTOM_BTN_BASE + btn_num, 1)
-                        ui.syn()
-                        if args.debug:
-                            print(f"Key {key_name} → Button {btn_num} PRESSED")  # Show the key being pressed
+    while True:
+        poller.poll()
+        for event in device.read():
+            if event.type != EV_KEY:
+                continue
+
+            code = event.code
+            value = event.value
+
+            key_name = code_to_name[code]
+
+            if key_name in MOD_BITS:
+                if value:
+                    mod_mask |= MOD_BITS[key_name]
                 else:
-                    # cancel non-matching pressing
-                    btn_num = int(combo_map[(mods, fkey)].replace('btn_', ''))
-                    if button_states[btn_num] == 'pressing':
-                        button_states[btn_num] = 'released'
-                        if args.debug:
-                            print(f"Key {key_name} → Button {btn_num} CANCELLED")  # Show the key being pressed
-        elif value == 0:  # key release
-            # F-key released triggers releasing state
-            for (mods, fkey), action in combo_map.items():
-                if fkey == key_name:
-                    btn_num = int(action.replace('btn_', ''))
-                    if button_states[btn_num] == 'pressed':
-                        button_states[btn_num] = 'releasing'
-                        if args.debug:
+                    mod_mask &= ~MOD_BITS[key_name]
+
+                # Finalize any releasing buttons that no longer have one of their modifiers held
+                released = sorted(b for b in releasing_btns if not (combo_by_btn[b][0] & mod_mask))
+                for btn_num in released:
+                    releasing_btns.discard(btn_num)
+                    write(EV_KEY, CUSTOM_BTN_BASE + btn_num, 0)
+                    if debug:
+                        print(f"{key_name} released, Button {btn_num} → RELEASED")
+                # One SYN_REPORT covers every button changed by this event
+                if released:
+                    syn()
+                continue
+
+            if value == 1:  # key press
+                # Press every released button whose combo matches the held modifiers and this key
+                pressed = [b for b in combo_lookup.get((mod_mask, code), ()) if b not in pressed_btns and b not in releasing_btns]
+                for btn_num in pressed:
+                    pressed_btns.add(btn_num)
+                    write(EV_KEY, CUSTOM_BTN_BASE + btn_num, 1)
+                    if debug:
+                        print(f"Key {key_name} → Button {btn_num} PRESSED")  # Show the key being pressed
+                if pressed:
+                    syn()
+            elif value == 0:  # key release
+                # F-key released triggers releasing state
+                for btn_num in btns_by_fkey.get(code, ()):
+                    if btn_num in pressed_btns:
+                        pressed_btns.discard(btn_num)
+                        releasing_btns.add(btn_num)
+                        if debug:
                             print(f"Key {key_name} → Button {btn_num} RELEASING")  # Show the key being pressed
-            # Now finalize releasing state if no other key is pressed
-            for btn_num, state in button_states.items():
-                if state == 'releasing' and not mod_keys_down:
-                    button_states[btn_num] = 'released'
-                    ui.write(ecodes.EV_KEY, CUSTOM_BTN_BASE + btn_num, 0)
-                    ui.syn()
-                    if args.debug:
-                        print(f"Key {key_name} → Button {btn_num} RELEASED")  # Show the key being released
+                # Now finalize releasing state if no modifier is held
+                if releasing_btns and not mod_mask:
+                    for btn_num in sorted(releasing_btns):
+                        write(EV_KEY, CUSTOM_BTN_BASE + btn_num, 0)
+                        if debug:
+                            print(f"Key {key_name} → Button {btn_num} RELEASED")  # Show the key being released
+                    syn()
+                    releasing_btns.clear()
 
 except KeyboardInterrupt:
     print("\nExiting.")
 finally:
+    poller.close()
     ui.close()
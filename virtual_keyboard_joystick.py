@@ -1,9 +1,20 @@
+import sys
 import argparse
 import os
+import asyncio
+import signal
 import fcntl
 import array
+import struct
+import ctypes
+import json
 from evdev import InputDevice, ecodes, UInput, list_devices, AbsInfo
 
+try:
+    import pyudev
+except ImportError:
+    pyudev = None
+
 parser = argparse.ArgumentParser(description="Map full keyboard to joystick buttons")
 parser.add_argument('--vendor', type=lambda x: int(x, 16), default=0x04B4, help='Vendor ID in hex (e.g. 04B4)')
 parser.add_argument('--product', type=lambda x: int(x, 16), default=0x0818, help='Product ID in hex (e.g. 0818)')
@@ -16,27 +27,107 @@ CUSTOM_BTN_BASE = 704
 
 # List of all common keyboard keys (KEY_RESERVED to KEY_MICMUTE typically covers 105 keys)
 ALL_KEYS = [code for code in range(ecodes.KEY_ESC, ecodes.KEY_MICMUTE + 1)]
+ALL_KEYS_SET = frozenset(ALL_KEYS)
 
-# Locate the physical keyboard device
-device_path = None
-for path in list_devices():
-    dev = InputDevice(path)
+# Only probe the target's event nodes according to udev, else every input device
+def candidate_paths():
+    if pyudev:
+        context = pyudev.Context()
+        paths = [
+            d.device_node for d in context.list_devices(subsystem='input', ID_VENDOR_ID=f'{TARGET_VENDOR:04x}')
+            if d.properties.get('ID_MODEL_ID') == f'{TARGET_PRODUCT:04x}'
+            and d.device_node and d.device_node.startswith('/dev/input/event')
+        ]
+        if paths:
+            return sorted(paths)
+    return list_devices()
+
+# The node that matched last time is remembered per vendor:product, along with its mtime,
+# so a restart while the keyboard stays plugged in can usually skip enumeration entirely
+PROBE_CACHE = f"/run/user/{os.getuid()}/macropad_probe.json"
+PROBE_KEY = f"{TARGET_VENDOR:04X}:{TARGET_PRODUCT:04X}"
+
+def load_probe_cache():
+    try:
+        with open(PROBE_CACHE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def cached_device_path():
+    entry = load_probe_cache().get(PROBE_KEY)
+    try:
+        if entry and os.stat(entry['path']).st_mtime == entry['mtime']:
+            return entry['path']
+    except (OSError, KeyError, TypeError):
+        pass
+    return None
+
+def store_device_path(path):
+    cache = load_probe_cache()
+    try:
+        cache[PROBE_KEY] = {'path': path, 'mtime': os.stat(path).st_mtime}
+        with open(PROBE_CACHE, 'w') as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+
+# Open a node and keep it only if it's the target keyboard; nodes we can't read are skipped
+def probe_device(path):
+    try:
+        dev = InputDevice(path)
+    except OSError:
+        return None
     if dev.info.vendor == TARGET_VENDOR and dev.info.product == TARGET_PRODUCT:
-        if any(k in dev.capabilities().get(ecodes.EV_KEY, []) for k in ALL_KEYS):
+        if not ALL_KEYS_SET.isdisjoint(dev.capabilities().get(ecodes.EV_KEY, ())):
+            return dev
+    dev.close()
+    return None
+
+# Locate the physical keyboard device, only enumerating if the cached node doesn't match
+device_path = None
+cached_path = cached_device_path()
+dev = probe_device(cached_path) if cached_path else None
+if dev:
+    device_path = cached_path
+else:
+    for path in candidate_paths():
+        if path == cached_path:
+            continue
+        dev = probe_device(path)
+        if dev:
             device_path = path
             break
 
+if device_path and device_path != cached_path:
+    store_device_path(device_path)
+
 if not device_path:
     print("Target device not found.")
     exit(1)
 
 device = InputDevice(device_path)
 device.grab()
+
+# Autorepeat is turned off at the source once forwarding starts, so held keys produce no
+# events at all. Only devices with EV_REP have a repeat setting to read or change.
+original_repeat = None
+if ecodes.EV_REP in device.capabilities():
+    original_repeat = device.repeat
 print(f"Listening to: {device.name} ({device_path})")
 
-# Map keyboard key codes to virtual button codes
-key_to_button = {key: CUSTOM_BTN_BASE + i for i, key in enumerate(ALL_KEYS)}
-virt_buttons = list(key_to_button.values())
+# Map keyboard key codes to virtual button codes.
+# ALL_KEYS is one contiguous range, so every key maps to its button by a fixed offset.
+FIRST_KEY = ALL_KEYS[0]
+LAST_KEY = ALL_KEYS[-1]
+BTN_SHIFT = CUSTOM_BTN_BASE - FIRST_KEY
+virt_buttons = [key + BTN_SHIFT for key in ALL_KEYS]
+
+# Key names for --debug output, by key offset
+KEY_NAMES = []
+for key in ALL_KEYS:
+    name = ecodes.KEY.get(key, str(key))
+    KEY_NAMES.append(name if isinstance(name, str) else name[0])
 
 # Virtual joystick device setup
 capabilities = {
@@ -45,54 +136,181 @@ capabilities = {
         ecodes.ABS_Z: AbsInfo(value=0, min=0, max=255, fuzz=0, flat=15, resolution=0)
     }
 }
+
+# Start listening for udev events before the virtual device exists, so the 'add' for its
+# js node can't be missed
+monitor = None
+if pyudev:
+    monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+    monitor.filter_by(subsystem='input')
+    monitor.start()
+
 ui = UInput(events=capabilities, name=f"{dev.name} Virtual Joystick",
             version=dev.version, vendor=dev.info.vendor, product=dev.info.product)
 
 print("Virtual joystick created.")
 print(f"Virtual joystick vendor:product = {ui.device.info.vendor:04X}:{ui.device.info.product:04X}")
 
-# Identify virtual joystick event and js node
-for path in list_devices():
-    try:
-        test_dev = InputDevice(path)
-        if test_dev.name == f"{dev.name} Virtual Joystick" and \
-           test_dev.info.vendor == dev.info.vendor and \
-           test_dev.info.product == dev.info.product:
-            print(f"Virtual device event node: {path}")
-            break
-    except Exception:
-        continue
+# UInput already opened its own event node as ui.device, so there's nothing to search for
+print(f"Virtual device event node: {ui.device.path}")
 
 def get_js_device_name(fd):
     buf = array.array('B', [0] * 128)
     fcntl.ioctl(fd, 0x80006a13 + (128 << 16), buf)
     return buf.tobytes().rstrip(b'\x00').decode('utf-8')
 
-for js in sorted(os.listdir('/dev/input')):
-    if js.startswith("js"):
-        full_path = f"/dev/input/{js}"
-        try:
-            with open(full_path, 'rb') as fd:
-                name = get_js_device_name(fd.fileno())
-                if name == f"{dev.name} Virtual Joystick":
-                    print(f"Virtual device joystick node: {full_path}\n")
-                    break
-        except Exception:
-            continue
+# With udev, the js node is announced by an 'add' event as soon as it exists.
+# Without it, or if no udev daemon announces anything, open every /dev/input/js*
+# and read the name back with an ioctl.
+def find_js_node(name):
+    if monitor:
+        for d in iter(lambda: monitor.poll(timeout=2), None):
+            if d.action == 'add' and d.sys_name.startswith('js') and d.parent and d.parent.attributes.asstring('name') == name:
+                return d.device_node
+    for js in sorted(os.listdir('/dev/input')):
+        if js.startswith("js"):
+            full_path = f"/dev/input/{js}"
+            try:
+                with open(full_path, 'rb') as fd:
+                    if get_js_device_name(fd.fileno()) == name:
+                        return full_path
+            except Exception:
+                continue
+    return None
+
+js_node = find_js_node(f"{dev.name} Virtual Joystick")
+# Nothing else needs uevents; dropping the monitor closes its netlink socket
+monitor = None
+if js_node:
+    print(f"Virtual device joystick node: {js_node}\n")
+
+# Events are written to uinput as raw struct input_event records (timeval, type, code, value),
+# packed into one buffer so a whole burst plus its SYN_REPORT records is a single write()
+INPUT_EVENT = struct.Struct('@llHHi')
+# SYN_REPORT never changes, so it is packed once and copied in wherever a frame ends
+SYN_EVENT = INPUT_EVENT.pack(0, 0, ecodes.EV_SYN, ecodes.SYN_REPORT, 0)
+
+# An asyncio reader callback forwards each readable burst straight to uinput.
+# SIGINT and SIGTERM stop the loop, so forward_events returns normally and cleanup always runs.
+# Everything the reader touches per event is bound to a local first.
+def forward_events(device, ui_fd, debug):
+    EV_KEY = ecodes.EV_KEY
+    EV_SYN = ecodes.EV_SYN
+    SYN_REPORT = ecodes.SYN_REPORT
+    key_names = KEY_NAMES
+    log = sys.stdout.write
+    first_key = FIRST_KEY
+    last_key = LAST_KEY
+    shift = BTN_SHIFT
+    event_size = INPUT_EVENT.size
+    syn_event = SYN_EVENT
+    pack_into = INPUT_EVENT.pack_into
+    readv = os.readv
+    device_fd = device.fd
+    unpack_all = INPUT_EVENT.iter_unpack
+    # Records are read into the same 64-event buffer every time
+    in_buf = bytearray(INPUT_EVENT.size * 64)
+    in_bufs = [in_buf]
+    in_view = memoryview(in_buf)
+    out = bytearray(event_size * 64)
+    # Last state sent for each virtual button, indexed by key offset
+    state = bytearray(last_key - first_key + 1)
+
+    write = os.write
+    loop = asyncio.new_event_loop()
+    stopped = loop.create_future()
+
+    def stop(exc=None):
+        if not stopped.done():
+            if exc:
+                stopped.set_exception(exc)
+            else:
+                stopped.set_result(None)
+
+    def on_readable():
+        # Drain everything queued. InputDevice already opens its fd non-blocking, so an empty
+        # queue raises BlockingIOError. Records are decoded by struct in C, skipping
+        # python-evdev's InputEvent objects.
+        off = 0
+        pending = False
+        while True:
+            try:
+                n = readv(device_fd, in_bufs)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                loop.remove_reader(device_fd)
+                stop(e)
+                return
+            for _, _, etype, code, value in unpack_all(in_view[:n]):
+                if etype == EV_KEY and first_key <= code <= last_key:
+                    # Autorepeats (value 2) and repeated edges don't change the button, so drop them
+                    idx = code - first_key
+                    if value == 2 or state[idx] == value:
+                        continue
+                    state[idx] = value
+                    # Keep room for this event and the closing SYN_REPORT
+                    if off + 2 * event_size > len(out):
+                        out.extend(bytes(len(out)))
+                    virt_button = code + shift
+                    pack_into(out, off, 0, 0, EV_KEY, virt_button, value)
+                    off += event_size
+                    pending = True
+                    if debug:
+                        log(f"{key_names[idx]} → Button {idx} {'DOWN' if value else 'UP'}\n")
+                elif etype == EV_SYN and code == SYN_REPORT and pending:
+                    # Mirror the keyboard's own frame boundaries
+                    out[off:off + event_size] = syn_event
+                    off += event_size
+                    pending = False
+        # Close off anything written since the last source frame, then send the burst
+        if pending:
+            out[off:off + event_size] = syn_event
+            off += event_size
+        if off:
+            write(ui_fd, out[:off])
+            # Debug lines are buffered and only flushed once the burst has been sent
+            if debug:
+                sys.stdout.flush()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop)
+    loop.add_reader(device_fd, on_readable)
+    try:
+        loop.run_until_complete(stopped)
+    finally:
+        loop.remove_reader(device_fd)
+        loop.close()
+
+# Keep scheduler wakeup jitter out of the path between the keyboard and uinput: realtime
+# priority if allowed (root or CAP_SYS_NICE), otherwise at least a better nice value, and
+# memory locked so it never waits on a page fault. Only a realtime loop is pinned to one CPU
+# to stay cache-hot; a normal-priority one is better off letting the scheduler move it.
+# None of this is required, so anything not permitted is skipped.
+try:
+    os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(20))
+except PermissionError:
+    try:
+        os.nice(-10)
+    except PermissionError:
+        print("Running at normal priority (run as root for realtime scheduling).")
+else:
+    os.sched_setaffinity(0, {min(os.sched_getaffinity(0))})
+MCL_CURRENT, MCL_FUTURE = 1, 2
+if ctypes.CDLL(None, use_errno=True).mlockall(MCL_CURRENT | MCL_FUTURE) == -1:
+    print(f"Memory not locked: {os.strerror(ctypes.get_errno())}")
 
 print("Press Ctrl+C to exit.")
 try:
-    for event in device.read_loop():
-        if event.type == ecodes.EV_KEY and event.code in key_to_button:
-            virt_button = key_to_button[event.code]
-            ui.write(ecodes.EV_KEY, virt_button, event.value)
-            ui.syn()
-            if args.debug:
-                state = "DOWN" if event.value else "UP"
-                keyname = ecodes.KEY[event.code]
-                btn_num = virt_button - CUSTOM_BTN_BASE
-                print(f"{keyname} → Button {btn_num} {state}")
-except KeyboardInterrupt:
+    if original_repeat:
+        device.repeat = (0, 0)
+    forward_events(device, ui.fd, args.debug)
     print("\nExiting.")
 finally:
+    if original_repeat:
+        # python-evdev reports a failed repeat ioctl (e.g. the keyboard was unplugged) as SystemError
+        try:
+            device.repeat = original_repeat
+        except (OSError, SystemError):
+            pass
     ui.close()